@@ -359,6 +359,11 @@ def normalize_server_url(url: str) -> str:
         return f"http://localhost:{parsed.port}"
     return url
 
+@st.cache_resource(show_spinner=False)
+def get_asr_client(server_url: str) -> ASRClient:
+    """按服务器URL复用ASR客户端，使健康检查缓存和连接池在脚本重跑与监控线程之间共享"""
+    return ASRClient(server_url)
+
 def enhanced_health_check(server_url: str) -> bool:
     """增强型健康检查，带指数退避重试"""
     from math import pow
@@ -367,9 +372,10 @@ def enhanced_health_check(server_url: str) -> bool:
     
     for i in range(max_retries):
         try:
-            client = ASRClient(server_url)
-            if client.check_health():
-                return True
+            # 每次重试都需要真实探测，不能命中共享客户端的健康缓存；用完即关闭连接池
+            with ASRClient(server_url) as client:
+                if client.check_health():
+                    return True
             time.sleep(pow(2, i))  # 指数退避
         except Exception:
             if i == max_retries - 1:
@@ -394,7 +400,7 @@ def start_status_monitor():
                 if not current_url:
                     break
                 
-                client = ASRClient(normalize_server_url(current_url))
+                client = get_asr_client(normalize_server_url(current_url))
                 new_status = "running" if client.check_health() else "error"
                 
                 if new_status != current_status:
@@ -548,8 +554,7 @@ def check_asr_health(server_url: str) -> bool:
     global ASR_SERVER_STATUS
     
     try:
-        client = ASRClient(server_url)
-        health = client.check_health()
+        health = get_asr_client(server_url).check_health()
         
         if health:
             ASR_SERVER_STATUS = "running"
@@ -3,46 +3,376 @@ ASR客户端模块
 用于与ASR服务通信，处理音频文件的语音识别
 """
 
+import asyncio
+import io
 import os
 import json
 import logging
 import requests
+import socket
 import subprocess
-from typing import Dict, Any, List, Optional
+import tempfile
+import threading
+import time
+import wave
+from abc import ABC, abstractmethod
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Any, List, Optional, Callable, Tuple, Iterable, Iterator
 import re
+
+try:
+    from requests_toolbelt import MultipartEncoder
+    has_toolbelt = True
+except ImportError:
+    has_toolbelt = False
+
+try:
+    import aiohttp
+    has_aiohttp = True
+except ImportError:
+    has_aiohttp = False
+
 logger = logging.getLogger(__name__)
 
-class ASRClient:
+# 批量识别的默认最大并发数
+DEFAULT_MAX_WORKERS = 8
+# 连接池大小，批量识别的并发数不会超过该值，保证每个线程都能复用连接
+POOL_MAXSIZE = max(DEFAULT_MAX_WORKERS, os.cpu_count() or 1)
+# 异步批量识别的默认最大并发数
+DEFAULT_ASYNC_CONCURRENCY = 16
+
+# HTTP 连接超时时间（秒）
+CONNECT_TIMEOUT = 5
+# 上传识别请求的最短读取超时（秒），实际超时按音频时长的两倍计算
+MIN_UPLOAD_READ_TIMEOUT = 600
+# 健康检查的超时时间（连接超时, 读取超时），单位秒
+HEALTH_TIMEOUT = (2, 5)
+
+# 健康检查结果的缓存时间（秒）
+HEALTH_CACHE_TTL = 5.0
+
+# whisper-cli 的最短超时时间（秒），实际超时按音频时长的两倍计算
+MIN_LOCAL_ASR_TIMEOUT = 300
+# 失败时从标准错误中读取并记录的最大字节数
+STDERR_PREVIEW_BYTES = 2048
+
+# ANSI 转义序列（仅用于兜底清理 whisper-cli 彩色输出）
+_ANSI_RE = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
+# whisper-cli 时间戳行，如 "[00:00:00.000 --> 00:00:10.500]  这里是文本"
+# 只接受 _parse_centiseconds 能解析的 时:分:秒 格式，其他格式的行按非段落行跳过
+_TS_RE = re.compile(r'^\s*\[\s*(\d+:\d{2}:\d{2}[.,]\d+)\s*-->\s*(\d+:\d{2}:\d{2}[.,]\d+)\s*\]\s*(.*)$')
+
+def _estimate_audio_seconds(audio_path: str) -> float:
+    """
+    估算音频时长，用于按音频长度计算超时时间
+    
+    Args:
+        audio_path: 音频文件路径
+        
+    Returns:
+        音频时长（秒），无法读取时返回0
+    """
+    try:
+        with wave.open(audio_path, 'rb') as wav_file:
+            return wav_file.getnframes() / wav_file.getframerate()
+    except (wave.Error, EOFError, OSError):
+        # 非 WAV 格式按 128kbps 的码率粗略估算时长
+        try:
+            return os.stat(audio_path).st_size / 16000
+        except OSError:
+            return 0
+
+def _ms_to_centiseconds(milliseconds: int) -> int:
+    """将毫秒四舍五入为厘秒，各解析路径统一使用，保证同一段落的时间一致"""
+    return (milliseconds + 5) // 10
+
+def _parse_centiseconds(timestamp: str) -> int:
+    """将 "00:01:02.500" 或 "00:01:02,500" 形式的时间戳解析为厘秒"""
+    hours, minutes, seconds = timestamp.replace(',', '.').split(':')
+    milliseconds = int(hours) * 3600000 + int(minutes) * 60000 + int(round(float(seconds) * 1000))
+    return _ms_to_centiseconds(milliseconds)
+
+def _format_centiseconds(centiseconds: int) -> str:
+    """将厘秒格式化为 whisper-cli 风格的时间戳，如 00:01:02.500"""
+    hours, rest = divmod(centiseconds, 360000)
+    minutes, rest = divmod(rest, 6000)
+    secs, cs = divmod(rest, 100)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}.{cs * 10:03d}"
+
+class TranscriptSegments(Sequence):
+    """
+    转录段落集合
+    
+    起止时间（厘秒）和文本分别存放在三个平行数组中，长录音的大量段落不必
+    为每段创建一个字典；按下标或迭代访问时才临时生成
+    {"start", "end", "text"} 形式的字典，兼容原有的段落列表用法。
+    
+    该对象不能直接 JSON 序列化，需要序列化时使用 to_list() 或 to_dict()。
+    """
+    
+    def __init__(self):
+        self.starts = array('I')
+        self.ends = array('I')
+        self.texts: List[str] = []
+    
+    def append(self, start: int, end: int, text: str):
+        """追加一个段落，起止时间单位为厘秒"""
+        self.starts.append(start)
+        self.ends.append(end)
+        self.texts.append(text)
+    
+    def __len__(self) -> int:
+        return len(self.texts)
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return {
+            "start": _format_centiseconds(self.starts[index]),
+            "end": _format_centiseconds(self.ends[index]),
+            "text": self.texts[index]
+        }
+    
+    def __repr__(self) -> str:
+        return f"TranscriptSegments({len(self)} 段)"
+    
+    def to_list(self) -> List[Dict[str, str]]:
+        """转换为字典列表，便于 JSON 序列化"""
+        return list(self)
+    
+    def to_dict(self) -> Dict[str, List]:
+        """转换为平行列表 {"starts", "ends", "texts"}（时间单位为厘秒），便于 JSON 序列化"""
+        return {
+            "starts": self.starts.tolist(),
+            "ends": self.ends.tolist(),
+            "texts": list(self.texts)
+        }
+
+class _RewindableMultipartEncoder:
+    """
+    可回绕的流式 multipart 请求体
+    
+    MultipartEncoder 只能读取一次，urllib3 重试时会通过 tell()/seek() 回绕请求体，
+    这里在回绕时重新打开文件流并以相同的 boundary 重建编码器。
+    """
+    
+    def __init__(self, file_obj, filename: str, content_type: str = 'audio/wav'):
+        self._file_obj = file_obj
+        self._filename = filename
+        self._content_type = content_type
+        self._encoder = self._build()
+        self._position = 0
+    
+    def _build(self, boundary: Optional[str] = None):
+        self._file_obj.seek(0)
+        return MultipartEncoder(
+            fields={'file': (self._filename, self._file_obj, self._content_type)},
+            boundary=boundary
+        )
+    
+    @property
+    def content_type(self) -> str:
+        return self._encoder.content_type
+    
+    @property
+    def len(self) -> int:
+        return self._encoder.len
+    
+    def read(self, size: int = -1) -> bytes:
+        chunk = self._encoder.read(size)
+        self._position += len(chunk)
+        return chunk
+    
+    def tell(self) -> int:
+        return self._position
+    
+    def seek(self, offset: int, whence: int = 0):
+        if offset != 0 or whence != 0:
+            raise io.UnsupportedOperation("只支持回绕到起始位置")
+        self._encoder = self._build(self._encoder.boundary_value)
+        self._position = 0
+
+class _BaseASRClient(ABC):
+    """ASR客户端公共基类，子类需实现 recognize_audio"""
+    
+    @abstractmethod
+    def recognize_audio(self, audio_path: str) -> Optional[Dict[str, Any]]:
+        """
+        识别音频文件
+        
+        Args:
+            audio_path: 音频文件路径
+        
+        Returns:
+            识别结果，失败时返回None
+        """
+    
+    def process_video(self, video_path: str, extract_audio_func=None) -> Optional[Dict[str, Any]]:
+        """
+        处理视频文件的音频
+        
+        Args:
+            video_path: 视频文件路径
+            extract_audio_func: 提取音频的函数，需要接受视频路径并返回音频路径
+            
+        Returns:
+            识别结果，失败时返回None
+        """
+        if not extract_audio_func:
+            logger.error("未提供提取音频函数")
+            return None
+            
+        try:
+            # 提取音频
+            audio_path = extract_audio_func(video_path)
+            if not audio_path:
+                logger.error("从视频提取音频失败")
+                return None
+            
+            try:
+                # 识别音频
+                return self.recognize_audio(audio_path)
+            finally:
+                # 清理临时音频文件
+                try:
+                    Path(audio_path).unlink(missing_ok=True)
+                except OSError as e:
+                    logger.warning(f"清理临时音频文件失败: {str(e)}")
+            
+        except Exception as e:
+            logger.error(f"处理视频时出错: {str(e)}")
+            return None
+
+class ASRClient(_BaseASRClient):
     """ASR客户端类"""
     
-    def __init__(self, server_url: str = "http://localhost:8000"):
+    def __init__(
+        self,
+        server_url: str = "http://localhost:8000",
+        session: Optional[requests.Session] = None,
+        read_timeout: Optional[float] = None
+    ):
         """
         初始化ASR客户端
         
         Args:
             server_url: ASR服务器URL
+            session: 可选的共享会话，未提供时创建带连接池的新会话
+            read_timeout: 识别请求的读取超时（秒），默认按音频时长的两倍计算且不少于 MIN_UPLOAD_READ_TIMEOUT
         """
         self.server_url = server_url.rstrip('/')
+        self.read_timeout = read_timeout
+        # 外部传入的会话由调用方负责关闭
+        self._owns_session = session is None
+        self._session = session if session is not None else self._create_session()
+        # 健康检查不重试且超时很短，服务不可用时能立即返回
+        self._health_session = self._create_session(max_retries=0)
+        # 健康检查缓存 (检查时间, 结果) 及上一次的状态，只在状态变化时记录日志
+        self._health_cache: Optional[Tuple[float, bool]] = None
+        self._last_health: Optional[bool] = None
+    
+    @staticmethod
+    def _create_session(max_retries: Optional[Any] = None) -> requests.Session:
+        """
+        创建复用连接的会话，避免每次请求都重新建立TCP连接
+        
+        Args:
+            max_retries: 重试策略，默认对瞬时的 5xx 和连接错误按指数退避重试
+        
+        Returns:
+            配置好连接池的会话
+        """
+        if max_retries is None:
+            # 读取超时不重试：请求体已发出，重试会重新上传整个文件并让服务端重复识别
+            max_retries = Retry(
+                total=5,
+                read=0,
+                backoff_factor=0.3,
+                status_forcelist=(500, 502, 503, 504),
+                allowed_methods=frozenset(['GET', 'POST']),
+                raise_on_status=False
+            )
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=POOL_MAXSIZE,
+            max_retries=max_retries
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+    
+    def close(self):
+        """释放连接池"""
+        self._health_session.close()
+        if self._owns_session:
+            self._session.close()
+    
+    def _upload_timeout(self, audio_path: str) -> Tuple[float, float]:
+        """
+        计算识别请求的超时时间
+        
+        Args:
+            audio_path: 音频文件路径
+            
+        Returns:
+            (连接超时, 读取超时)
+        """
+        if self.read_timeout is not None:
+            return (CONNECT_TIMEOUT, self.read_timeout)
+        return (CONNECT_TIMEOUT, max(MIN_UPLOAD_READ_TIMEOUT, _estimate_audio_seconds(audio_path) * 2))
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
     
     def check_health(self) -> bool:
         """
-        检查ASR服务健康状态
+        检查ASR服务健康状态，结果缓存 HEALTH_CACHE_TTL 秒
+        
+        Returns:
+            服务是否健康
+        """
+        now = time.monotonic()
+        if self._health_cache is not None and now - self._health_cache[0] < HEALTH_CACHE_TTL:
+            return self._health_cache[1]
+        
+        healthy = self._fetch_health()
+        self._health_cache = (now, healthy)
+        if healthy != self._last_health:
+            logger.info(f"ASR服务状态: {'可用' if healthy else '不可用'}")
+            self._last_health = healthy
+        return healthy
+    
+    def _fetch_health(self) -> bool:
+        """
+        请求ASR服务的健康检查接口，优先使用无响应体的 HEAD 请求
         
         Returns:
             服务是否健康
         """
         try:
-            response = requests.get(f"{self.server_url}/health")
-            if response.status_code == 200:
-                data = response.json()
-                logger.info(f"服务状态: {data['status']}")
-                logger.info(f"模型已加载: {data['model_loaded']}")
-                return data['model_loaded']
-            else:
-                logger.error(f"服务检查失败: {response.status_code}")
-                return False
-        except requests.exceptions.ConnectionError:
-            logger.error("无法连接到ASR服务，请确保服务正在运行")
+            url = f"{self.server_url}/health"
+            response = self._health_session.head(url, timeout=HEALTH_TIMEOUT)
+            model_loaded = response.headers.get('X-Model-Loaded')
+            if response.status_code == 200 and model_loaded is not None:
+                # 服务端通过响应头返回模型加载状态
+                return model_loaded.lower() == 'true'
+            
+            if response.status_code in (200, 405, 501):
+                # 旧版服务不支持 HEAD，或响应中没有模型状态（如代理、框架自动应答的 HEAD），退回 GET
+                response = self._health_session.get(url, timeout=HEALTH_TIMEOUT)
+                if response.status_code == 200:
+                    return bool(response.json()['model_loaded'])
+            
+            logger.error(f"服务检查失败: {response.status_code}")
             return False
         except Exception as e:
             logger.error(f"检查服务健康状态时出错: {str(e)}")
@@ -58,23 +388,34 @@ class ASRClient:
         Returns:
             识别结果，失败时返回None
         """
-        # 检查文件是否存在
-        if not os.path.exists(audio_path):
+        # 检查文件是否存在，同时获取文件大小
+        try:
+            file_size = os.stat(audio_path).st_size
+        except OSError:
             logger.error(f"文件不存在: {audio_path}")
             return None
         
-        # 准备文件
-        files = {
-            'file': (os.path.basename(audio_path), open(audio_path, 'rb'))
-        }
-        
         try:
-            # 发送请求
-            logger.info(f"正在识别音频文件: {audio_path}")
-            response = requests.post(f"{self.server_url}/asr/recognize", files=files)
-            
-            # 关闭文件
-            files['file'][1].close()
+            # 发送请求（文件句柄由上下文管理器负责关闭）
+            logger.info(f"正在识别音频文件: {audio_path} ({file_size} 字节)")
+            timeout = self._upload_timeout(audio_path)
+            with open(audio_path, 'rb') as f:
+                if has_toolbelt:
+                    # 流式上传，按块读取文件，避免整个文件读入内存
+                    encoder = _RewindableMultipartEncoder(f, os.path.basename(audio_path))
+                    response = self._session.post(
+                        f"{self.server_url}/asr/recognize",
+                        data=encoder,
+                        headers={'Content-Type': encoder.content_type},
+                        timeout=timeout
+                    )
+                else:
+                    files = {'file': (os.path.basename(audio_path), f)}
+                    response = self._session.post(
+                        f"{self.server_url}/asr/recognize",
+                        files=files,
+                        timeout=timeout
+                    )
             
             # 处理响应
             if response.status_code == 200:
@@ -88,118 +429,176 @@ class ASRClient:
                 logger.error(f"错误信息: {response.text}")
                 return None
                 
-        except requests.exceptions.ConnectionError:
-            logger.error("无法连接到ASR服务，请确保服务正在运行")
-            return None
         except Exception as e:
             logger.error(f"识别时发生错误: {str(e)}")
-            # 确保文件句柄被关闭
-            try:
-                files['file'][1].close()
-            except:
-                pass
             return None
     
-    def process_video(self, video_path: str, extract_audio_func=None) -> Optional[Dict[str, Any]]:
+    def recognize_multiple_files(
+        self,
+        audio_files: List[str],
+        max_workers: Optional[int] = None,
+        progress_callback: Optional[Callable[[str, Optional[Dict[str, Any]]], None]] = None
+    ) -> List[Dict[str, Any]]:
         """
-        处理视频文件的音频
+        批量并发识别多个音频文件
         
         Args:
-            video_path: 视频文件路径
-            extract_audio_func: 提取音频的函数，需要接受视频路径并返回音频路径
-            
+            audio_files: 音频文件路径列表
+            max_workers: 最大并发数，默认为 min(文件数, DEFAULT_MAX_WORKERS)，不超过 POOL_MAXSIZE
+            progress_callback: 每个文件完成时调用，参数为 (文件路径, 识别结果或None)
+        
+        Returns:
+            识别结果列表，顺序与输入一致，失败的文件不包含在内
+        """
+        if not audio_files:
+            return []
+        
+        if max_workers is None:
+            max_workers = min(len(audio_files), DEFAULT_MAX_WORKERS)
+        # 线程数超过连接池大小时，多出的连接会被丢弃而无法复用
+        max_workers = min(max_workers, POOL_MAXSIZE)
+        
+        results_by_index: Dict[int, Dict[str, Any]] = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.recognize_audio, audio_file): index
+                for index, audio_file in enumerate(audio_files)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                audio_file = audio_files[index]
+                result = future.result()
+                logger.info(f"文件处理完成: {audio_file}")
+                if result:
+                    results_by_index[index] = {
+                        "file": audio_file,
+                        "result": result
+                    }
+                if progress_callback:
+                    try:
+                        progress_callback(audio_file, result)
+                    except Exception as e:
+                        logger.warning(f"进度回调执行失败: {str(e)}")
+        
+        return [results_by_index[i] for i in sorted(results_by_index)]
+    
+    async def recognize_audio_async(self, session: "aiohttp.ClientSession", audio_path: str) -> Optional[Dict[str, Any]]:
+        """
+        异步调用ASR API进行语音识别
+        
+        Args:
+            session: aiohttp 会话
+            audio_path: 音频文件路径
+        
         Returns:
             识别结果，失败时返回None
         """
-        if not extract_audio_func:
-            logger.error("未提供提取音频函数")
+        try:
+            file_size = os.stat(audio_path).st_size
+        except OSError:
+            logger.error(f"文件不存在: {audio_path}")
             return None
-            
+        
         try:
-            # 提取音频
-            audio_path = extract_audio_func(video_path)
-            if not audio_path:
-                logger.error("从视频提取音频失败")
-                return None
-                
-            # 识别音频
-            result = self.recognize_audio(audio_path)
-            
-            # 清理临时音频文件
-            if os.path.exists(audio_path):
-                try:
-                    os.unlink(audio_path)
-                except Exception as e:
-                    logger.warning(f"清理临时音频文件失败: {str(e)}")
-            
-            return result
-            
+            logger.info(f"正在识别音频文件: {audio_path} ({file_size} 字节)")
+            with open(audio_path, 'rb') as f:
+                # FormData 会分块读取文件对象，不会把整个文件读入内存
+                form = aiohttp.FormData()
+                form.add_field('file', f, filename=os.path.basename(audio_path))
+                timeout = aiohttp.ClientTimeout(
+                    connect=CONNECT_TIMEOUT,
+                    sock_read=self._upload_timeout(audio_path)[1]
+                )
+                async with session.post(f"{self.server_url}/asr/recognize", data=form, timeout=timeout) as response:
+                    if response.status == 200:
+                        result = await response.json()
+                        logger.info(f"识别成功: {result.get('filename', audio_path)}")
+                        return result
+                    logger.error(f"识别失败: {response.status}")
+                    logger.error(f"错误信息: {await response.text()}")
+                    return None
         except Exception as e:
-            logger.error(f"处理视频时出错: {str(e)}")
+            logger.error(f"识别时发生错误: {str(e)}")
             return None
-
-    def recognize_multiple_files(self, audio_files: List[str]) -> List[Dict[str, Any]]:
+    
+    async def recognize_multiple_async(
+        self,
+        audio_files: List[str],
+        concurrency: int = DEFAULT_ASYNC_CONCURRENCY
+    ) -> List[Dict[str, Any]]:
+        """
+        在单个事件循环中异步批量识别多个音频文件
+        
+        Args:
+            audio_files: 音频文件路径列表
+            concurrency: 最大并发请求数
+        
+        Returns:
+            识别结果列表，顺序与输入一致，失败的文件不包含在内
         """
-        批量识别多个音频文件
+        if not has_aiohttp:
+            raise ImportError("aiohttp未安装，无法使用异步批量识别，请安装: pip install aiohttp")
+        
+        semaphore = asyncio.Semaphore(concurrency)
+        connector = aiohttp.TCPConnector(limit=concurrency)
+        
+        async with aiohttp.ClientSession(connector=connector) as session:
+            async def recognize_with_limit(audio_file: str) -> Optional[Dict[str, Any]]:
+                async with semaphore:
+                    return await self.recognize_audio_async(session, audio_file)
+            
+            results = await asyncio.gather(*(recognize_with_limit(f) for f in audio_files))
+        
+        return [
+            {"file": audio_file, "result": result}
+            for audio_file, result in zip(audio_files, results)
+            if result
+        ]
+    
+    def recognize_multiple_files_asyncio(
+        self,
+        audio_files: List[str],
+        concurrency: int = DEFAULT_ASYNC_CONCURRENCY
+    ) -> List[Dict[str, Any]]:
+        """
+        recognize_multiple_async 的同步封装，供非异步代码调用
         
         Args:
             audio_files: 音频文件路径列表
+            concurrency: 最大并发请求数
         
         Returns:
-            识别结果列表
-        """
-        results = []
-        for audio_file in audio_files:
-            logger.info(f"\n正在处理文件: {audio_file}")
-            result = self.recognize_audio(audio_file)
-            if result:
-                results.append({
-                    "file": audio_file,
-                    "result": result
-                })
-        return results
-    
-class LocalASRClient:
+            识别结果列表，顺序与输入一致，失败的文件不包含在内
+        """
+        if not audio_files:
+            return []
+        return asyncio.run(self.recognize_multiple_async(audio_files, concurrency))
+    
+class LocalASRClient(_BaseASRClient):
     """本地 whisper.cpp ASR 客户端类"""
     
-    def __init__(self, whisper_cli_path: str, model_path: str):
+    def __init__(self, whisper_cli_path: str, model_path: str, lang: str = "zh"):
         """
         初始化本地 ASR 客户端
         
         Args:
             whisper_cli_path: whisper-cli 可执行文件路径
             model_path: ggml 模型文件路径
+            lang: 识别语言，默认中文
         """
         self.whisper_cli_path = whisper_cli_path
         self.model_path = model_path
-    
-    def check_health(self) -> bool:
-        """
-        检查本地 ASR 是否就绪（检查文件是否存在）
+        self.lang = lang
+        
+        # 路径和环境在客户端生命周期内不变，只在初始化时计算一次
+        self._ready = os.path.exists(whisper_cli_path) and os.path.exists(model_path)
         
-        Returns:
-            模型和可执行文件是否存在
-        """
-        return os.path.exists(self.whisper_cli_path) and os.path.exists(self.model_path)
-    
-    def recognize_audio(self, audio_path: str) -> Optional[Dict[str, Any]]:
-        # ... 前面的代码（命令构建等）保持不变 ...
-        command = [
-            self.whisper_cli_path,
-            "-m", self.model_path,
-            "-f", audio_path,
-            "-otxt",
-            "-l", "zh",  # 如果是中文课程视频
-            "-pc"
-        ]
-        logger.info(f"执行命令: {' '.join(command)}")
-        # 注意：这里暂时去掉 encoding='utf-8' 参数，先获取原始字节
         # ===== 设置动态库路径（使用绝对路径） =====
         # 将 whisper_cli_path 转换为绝对路径
-        abs_cli_path = os.path.abspath(self.whisper_cli_path)
+        abs_cli_path = os.path.abspath(whisper_cli_path)
         cli_dir = os.path.dirname(abs_cli_path)          # .../build/bin
         build_dir = os.path.dirname(cli_dir)              # .../build
-    
+        
         # 列出所有可能的库目录（绝对路径）
         possible_lib_dirs = [
             os.path.join(build_dir, "src"),                       # .../build/src
@@ -207,124 +606,191 @@ class LocalASRClient:
             os.path.join(build_dir, "ggml", "src", "ggml-blas"),  # .../build/ggml/src/ggml-blas
             os.path.join(build_dir, "ggml", "src", "ggml-metal"), # .../build/ggml/src/ggml-metal
         ]
-    
+        
         # 只保留实际存在的目录
         existing_lib_dirs = [d for d in possible_lib_dirs if os.path.exists(d)]
-    
-        env = os.environ.copy()
+        
+        self._env = os.environ.copy()
         if existing_lib_dirs:
             # 用冒号拼接所有库目录
             lib_path = ":".join(existing_lib_dirs)
-            existing_dyld = env.get('DYLD_LIBRARY_PATH', '')
+            existing_dyld = self._env.get('DYLD_LIBRARY_PATH', '')
             if existing_dyld:
-                env['DYLD_LIBRARY_PATH'] = lib_path + ":" + existing_dyld
+                self._env['DYLD_LIBRARY_PATH'] = lib_path + ":" + existing_dyld
             else:
-                env['DYLD_LIBRARY_PATH'] = lib_path
-            logger.info(f"设置 DYLD_LIBRARY_PATH={env['DYLD_LIBRARY_PATH']}")
+                self._env['DYLD_LIBRARY_PATH'] = lib_path
+            logger.info(f"设置 DYLD_LIBRARY_PATH={self._env['DYLD_LIBRARY_PATH']}")
         # ================================
+        
+        # 从源头关闭彩色输出，避免再对输出做 ANSI 转义序列清理
+        self._env['NO_COLOR'] = '1'
+        self._env['TERM'] = 'dumb'
+        
+        self._command_prefix = [whisper_cli_path, "-m", model_path]
     
-        try:
-            result = subprocess.run(
-                command,
-                capture_output=True,
-                check=False,
-                timeout=120,
-                env=env  # 传入环境变量
+    def check_health(self) -> bool:
+        """
+        检查本地 ASR 是否就绪（文件是否存在已在初始化时检查）
+        
+        Returns:
+            模型和可执行文件是否存在
+        """
+        return self._ready
+    
+    @staticmethod
+    def _load_json_segments(json_path: str) -> Optional[TranscriptSegments]:
+        """
+        读取 whisper-cli -oj 生成的 JSON 结果
+        
+        Args:
+            json_path: JSON 结果文件路径
+            
+        Returns:
+            段落列表，文件不存在时返回None
+        """
+        if not os.path.exists(json_path):
+            return None
+        
+        with open(json_path, 'r', encoding='utf-8', errors='ignore') as f:
+            data = json.load(f)
+        
+        # offsets 为毫秒整数，直接换算成厘秒，无需解析时间戳字符串
+        segments = TranscriptSegments()
+        for item in data.get("transcription", []):
+            segments.append(
+                _ms_to_centiseconds(item["offsets"]["from"]),
+                _ms_to_centiseconds(item["offsets"]["to"]),
+                item["text"].strip()
             )
-
-            # 1. 首先，无论成功与否，都记录原始返回码和输出大小
-            logger.info(f"命令执行完成，返回码: {result.returncode}")
-            logger.info(f"标准输出原始字节长度: {len(result.stdout)}")
-            logger.info(f"标准错误原始字节长度: {len(result.stderr)}")
+        return segments
+    
+    @staticmethod
+    def _iter_stdout_lines(lines: Iterable[str]) -> Iterator[Tuple[str, str, str]]:
+        """
+        从 whisper-cli 标准输出的行中提取时间戳段落
+        
+        Args:
+            lines: 标准输出的文本行
             
-            # 2. 尝试安全地解码输出（优先使用utf-8，失败则用错误忽略策略）
-            stdout_text = ""
-            stderr_text = ""
-            try:
-                stdout_text = result.stdout.decode('utf-8')
-            except UnicodeDecodeError:
-                # 如果utf-8解码失败，使用错误忽略模式，确保得到部分文本
-                stdout_text = result.stdout.decode('utf-8', errors='ignore')
-                logger.warning("标准输出包含非UTF-8字符，已忽略。")
+        Yields:
+            (开始时间, 结束时间, 文本)
+        """
+        for raw_line in lines:
+            # 彩色输出已关闭，仅在确实包含 ANSI 转义序列时才清理
+            line = _ANSI_RE.sub('', raw_line) if '\x1b' in raw_line else raw_line
+            m = _TS_RE.match(line)
+            if m:
+                start_time, end_time, text = m.groups()
+                yield start_time, end_time, text.strip()
+    
+    @staticmethod
+    def _estimate_timeout(audio_path: str) -> float:
+        """
+        根据音频时长估算 whisper-cli 的超时时间
+        
+        Args:
+            audio_path: 音频文件路径
             
-            try:
-                stderr_text = result.stderr.decode('utf-8')
-            except UnicodeDecodeError:
-                stderr_text = result.stderr.decode('utf-8', errors='ignore')
-            # ========== 新增：去除 ANSI 转义序列 ==========
-            ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
-            stdout_text = ansi_escape.sub('', stdout_text)
-            # =============================================
-
-            # 继续解析段落（使用清理后的文本）
-            segments = []
-            lines = stdout_text.strip().split('\n')
-            for line in lines:
-                line = line.strip()
-                if line.startswith('[') and '-->' in line:
-                    try:
-                        time_part, text = line.split(']', 1)
-                        time_part = time_part.strip('[')
-                        start_time, end_time = time_part.split('-->')
-                        segments.append({
-                            "start": start_time.strip(),
-                            "end": end_time.strip(),
-                            "text": text.strip()   # text 现在已不含 ANSI 码
-                        })
-                    except Exception as parse_error:
-                        logger.warning(f"解析行时出错（已跳过）: {line[:100]}... 错误: {parse_error}")
-            # 3. 记录解码后的文本（前500字符）
-            if stderr_text:
-                logger.info(f"标准错误 (解码后): {stderr_text[:500]}")
+        Returns:
+            超时时间（秒），为音频时长的两倍且不少于 MIN_LOCAL_ASR_TIMEOUT
+        """
+        return max(MIN_LOCAL_ASR_TIMEOUT, _estimate_audio_seconds(audio_path) * 2)
+    
+    @staticmethod
+    def _parse_stdout_segments(stdout_file) -> TranscriptSegments:
+        """
+        逐行解析 whisper-cli 标准输出中的时间戳段落（JSON 结果缺失时的后备方案）
+        
+        Args:
+            stdout_file: 保存标准输出的二进制文件对象
             
-            # 4. 判断是否成功：返回码为0通常意味着成功
-            if result.returncode == 0:
-                # 成功！现在 stdout_text 应该包含带时间戳的转录文本
-                logger.info(f"语音识别成功！输出文本长度: {len(stdout_text)} 字符")
-                
-                # ========== 解析 whisper-cli 的输出文本 ==========
-                segments = []
-                lines = stdout_text.strip().split('\n')
-                
-                for line in lines:
-                    line = line.strip()
-                    # 匹配类似 "[00:00:00.000 --> 00:00:10.500]  这里是文本" 的行
-                    if line.startswith('[') and '-->' in line:
-                        try:
-                            # 分割时间戳和文本
-                            time_part, text = line.split(']', 1)
-                            time_part = time_part.strip('[')  # 移除开头的'['
-                            start_time, end_time = time_part.split('-->')
-                            
-                            segments.append({
-                                "start": start_time.strip(),
-                                "end": end_time.strip(),
-                                "text": text.strip()
-                            })
-                        except Exception as parse_error:
-                            # 如果某一行解析失败，记录警告但继续处理其他行
-                            logger.warning(f"解析行时出错（已跳过）: {line[:100]}... 错误: {parse_error}")
+        Returns:
+            段落列表
+        """
+        segments = TranscriptSegments()
+        stdout_file.seek(0)
+        text_wrapper = io.TextIOWrapper(stdout_file, encoding='utf-8', errors='ignore')
+        try:
+            for start_time, end_time, text in LocalASRClient._iter_stdout_lines(text_wrapper):
+                segments.append(_parse_centiseconds(start_time), _parse_centiseconds(end_time), text)
+        finally:
+            # 底层文件由调用方关闭
+            text_wrapper.detach()
+        return segments
+    
+    def recognize_audio(self, audio_path: str) -> Optional[Dict[str, Any]]:
+        """
+        调用本地 whisper-cli 进行语音识别
+        
+        Args:
+            audio_path: 音频文件路径
+        
+        Returns:
+            识别结果，失败时返回None
+        """
+        timeout = self._estimate_timeout(audio_path)
+        try:
+            # 输出写入临时文件而不是管道，避免管道缓冲区写满导致的阻塞，
+            # 同时长音频的大量输出不会整块驻留在内存中
+            with tempfile.TemporaryDirectory() as output_dir, \
+                    tempfile.TemporaryFile() as stdout_file, \
+                    tempfile.TemporaryFile() as stderr_file:
+                # 使用 -oj 让 whisper-cli 直接输出结构化的 JSON 结果
+                output_prefix = os.path.join(output_dir, "transcript")
+                command = self._command_prefix + [
+                    "-f", audio_path,
+                    "-oj",
+                    "-of", output_prefix,
+                    "-l", self.lang,
+                ]
+                logger.info(f"执行命令: {' '.join(command)}")
                 
-                logger.info(f"成功解析出 {len(segments)} 个文本段落")
-                # ========== 解析结束 ==========
+                process = subprocess.Popen(
+                    command,
+                    stdout=stdout_file,
+                    stderr=stderr_file,
+                    env=self._env  # 传入环境变量
+                )
+                try:
+                    returncode = process.wait(timeout=timeout)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.wait()
+                    raise
+
+                # 1. 首先，无论成功与否，都记录原始返回码和输出大小
+                logger.info(f"命令执行完成，返回码: {returncode}")
+                logger.info(f"标准输出原始字节长度: {stdout_file.tell()}")
+                logger.info(f"标准错误原始字节长度: {stderr_file.tell()}")
                 
-                # 返回解析后的结果字典
-                return {
-                    "status": "success",
-                    "filename": os.path.basename(audio_path),
-                    "segments": segments,  # 使用上面解析出来的段落列表
-                    "full_text": stdout_text,  # 完整的原始输出文本
-                    "processing_time": None,
-                    "model": "whisper.cpp-ggml-base"
-                }
-            else:
-                # 命令执行失败（返回非零码）
-                logger.error(f"whisper-cli 执行失败，返回码: {result.returncode}")
-                logger.error(f"错误详情 (stderr): {stderr_text[:1000]}")  # 显示前1000字符
-                return None
+                # 2. 判断是否成功：返回码为0通常意味着成功
+                if returncode == 0:
+                    segments = self._load_json_segments(output_prefix + ".json")
+                    if segments is None:
+                        logger.warning("未找到 JSON 结果文件，改为解析标准输出")
+                        segments = self._parse_stdout_segments(stdout_file)
+                    
+                    logger.info(f"语音识别成功！成功解析出 {len(segments)} 个文本段落")
+                    
+                    # 返回解析后的结果字典
+                    return {
+                        "status": "success",
+                        "filename": os.path.basename(audio_path),
+                        "segments": segments,  # 使用上面解析出来的段落列表
+                        "processing_time": None,
+                        "model": "whisper.cpp-ggml-base"
+                    }
+                else:
+                    # 命令执行失败（返回非零码）
+                    # 只在失败时读取并解码标准错误的开头部分（非UTF-8字符直接忽略）
+                    stderr_file.seek(0)
+                    stderr_text = stderr_file.read(STDERR_PREVIEW_BYTES).decode('utf-8', errors='ignore')
+                    logger.error(f"whisper-cli 执行失败，返回码: {returncode}")
+                    logger.error(f"错误详情 (stderr): {stderr_text}")
+                    return None
                 
         except subprocess.TimeoutExpired:
-            logger.error(f"命令执行超时（超过120秒）")
+            logger.error(f"命令执行超时（超过{timeout:.0f}秒）")
             return None
         except FileNotFoundError:
             logger.error(f"找不到命令或文件: {self.whisper_cli_path}")
@@ -333,27 +799,264 @@ class LocalASRClient:
             logger.error(f"执行命令时发生未知错误: {str(e)}", exc_info=True)
             return None
     
-    # 以下方法可以保持与原 ASRClient 相同的接口，内部调用 recognize_audio
-    def process_video(self, video_path: str, extract_audio_func=None) -> Optional[Dict[str, Any]]:
-        """处理视频文件的音频（接口兼容）"""
-        # 这里可以复用原 ASRClient 的 process_video 逻辑，只需替换 recognize_audio 调用
-        # 或者直接调用原 ASRClient 的 process_video 方法，但需要稍作调整
-        pass
+    def iter_segments(self, audio_path: str) -> Iterator[Dict[str, str]]:
+        """
+        流式识别音频，whisper-cli 每输出一个段落就立即产出，便于长音频显示进度
+        
+        Args:
+            audio_path: 音频文件路径
+            
+        Yields:
+            段落字典 {"start", "end", "text"}
+            
+        Raises:
+            RuntimeError: whisper-cli 执行失败或超时
+        """
+        timeout = self._estimate_timeout(audio_path)
+        command = self._command_prefix + ["-f", audio_path, "-l", self.lang]
+        logger.info(f"执行命令: {' '.join(command)}")
+        
+        # 标准错误写入临时文件，只有标准输出走管道并被持续读取，不会因缓冲区写满而阻塞
+        with tempfile.TemporaryFile() as stderr_file:
+            process = subprocess.Popen(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=stderr_file,
+                bufsize=1 << 20,
+                env=self._env
+            )
+            timed_out = threading.Event()
+            
+            def kill_on_timeout():
+                timed_out.set()
+                process.kill()
+            
+            timer = threading.Timer(timeout, kill_on_timeout)
+            # 生成器可能被调用方遗弃，计时线程不应阻止解释器退出
+            timer.daemon = True
+            timer.start()
+            try:
+                text_wrapper = io.TextIOWrapper(process.stdout, encoding='utf-8', errors='ignore')
+                for start_time, end_time, text in self._iter_stdout_lines(text_wrapper):
+                    # 与 recognize_audio 的结果使用相同的时间戳格式
+                    yield {
+                        "start": _format_centiseconds(_parse_centiseconds(start_time)),
+                        "end": _format_centiseconds(_parse_centiseconds(end_time)),
+                        "text": text
+                    }
+                process.wait()
+            finally:
+                timer.cancel()
+                if process.poll() is None:
+                    # 调用方提前停止迭代时终止子进程
+                    process.kill()
+                    process.wait()
+                process.stdout.close()
+            
+            if timed_out.is_set():
+                raise RuntimeError(f"命令执行超时（超过{timeout:.0f}秒）")
+            if process.returncode != 0:
+                stderr_file.seek(0)
+                stderr_text = stderr_file.read(STDERR_PREVIEW_BYTES).decode('utf-8', errors='ignore')
+                raise RuntimeError(f"whisper-cli 执行失败，返回码: {process.returncode}，错误详情: {stderr_text}")
+
+class LocalASRServerClient(LocalASRClient):
+    """常驻 whisper-server 的本地 ASR 客户端类，模型只加载一次"""
+    
+    def __init__(
+        self,
+        whisper_cli_path: str,
+        model_path: str,
+        whisper_server_path: Optional[str] = None,
+        lang: str = "zh",
+        startup_timeout: float = 60.0
+    ):
+        """
+        初始化常驻服务模式的本地 ASR 客户端
+        
+        Args:
+            whisper_cli_path: whisper-cli 可执行文件路径（服务不可用时使用）
+            model_path: ggml 模型文件路径
+            whisper_server_path: whisper-server 可执行文件路径，默认与 whisper-cli 同目录
+            lang: 识别语言，默认中文
+            startup_timeout: 等待服务加载模型的最长时间（秒）
+        """
+        super().__init__(whisper_cli_path, model_path, lang)
+        if whisper_server_path is None:
+            whisper_server_path = os.path.join(os.path.dirname(whisper_cli_path), "whisper-server")
+        self.whisper_server_path = whisper_server_path
+        self.startup_timeout = startup_timeout
+        self.server_url: Optional[str] = None
+        self._process: Optional[subprocess.Popen] = None
+        # 本地服务逐个处理请求，重试只会让同一文件重复排队识别，因此不做任何重试
+        self._session = ASRClient._create_session(max_retries=0)
+    
+    @staticmethod
+    def _find_free_port() -> int:
+        """获取一个空闲的本地端口"""
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+    
+    def is_running(self) -> bool:
+        """whisper-server 进程是否在运行"""
+        return self._process is not None and self._process.poll() is None
+    
+    def start(self) -> bool:
+        """
+        启动 whisper-server 并等待模型加载完成
+        
+        Returns:
+            服务是否启动成功
+        """
+        if self.is_running():
+            return True
+        
+        port = self._find_free_port()
+        command = [
+            self.whisper_server_path,
+            "-m", self.model_path,
+            "--host", "127.0.0.1",
+            "--port", str(port),
+            "-l", self.lang,
+        ]
+        logger.info(f"启动 whisper-server: {' '.join(command)}")
+        try:
+            # 不读取服务输出，直接丢弃，避免管道写满阻塞服务进程
+            self._process = subprocess.Popen(
+                command,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                env=self._env
+            )
+        except OSError as e:
+            logger.warning(f"无法启动 whisper-server，将使用 whisper-cli: {str(e)}")
+            self._process = None
+            return False
+        
+        self.server_url = f"http://127.0.0.1:{port}"
+        deadline = time.monotonic() + self.startup_timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                logger.warning(f"whisper-server 意外退出，返回码: {self._process.returncode}")
+                break
+            try:
+                response = self._session.get(f"{self.server_url}/health", timeout=1)
+                if response.status_code == 200:
+                    logger.info(f"whisper-server 已就绪: {self.server_url}")
+                    return True
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(0.2)
+        else:
+            logger.warning(f"whisper-server 启动超时（超过{self.startup_timeout}秒）")
+        
+        self.stop()
+        return False
+    
+    def stop(self):
+        """停止 whisper-server"""
+        if self._process is None:
+            return
+        if self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        self._process = None
+        self.server_url = None
+    
+    def close(self):
+        """停止服务并释放连接池"""
+        self.stop()
+        self._session.close()
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+    
+    def recognize_audio(self, audio_path: str) -> Optional[Dict[str, Any]]:
+        """
+        通过常驻的 whisper-server 进行语音识别，服务未运行时退回到 whisper-cli
+        
+        Args:
+            audio_path: 音频文件路径
+        
+        Returns:
+            识别结果，失败时返回None
+        """
+        if not self.is_running():
+            return super().recognize_audio(audio_path)
+        
+        try:
+            logger.info(f"正在通过 whisper-server 识别音频文件: {audio_path}")
+            with open(audio_path, 'rb') as f:
+                response = self._session.post(
+                    f"{self.server_url}/inference",
+                    files={'file': (os.path.basename(audio_path), f)},
+                    data={'response_format': 'verbose_json', 'language': self.lang},
+                    # 推理耗时与音频时长相关，读取超时与 whisper-cli 模式保持一致
+                    timeout=(CONNECT_TIMEOUT, self._estimate_timeout(audio_path))
+                )
+            
+            if response.status_code != 200:
+                logger.error(f"whisper-server 识别失败: {response.status_code}")
+                logger.error(f"错误信息: {response.text[:1000]}")
+                return None
+            
+            data = response.json()
+            segments = TranscriptSegments()
+            for seg in data.get("segments", []):
+                segments.append(
+                    _ms_to_centiseconds(int(round(seg["start"] * 1000))),
+                    _ms_to_centiseconds(int(round(seg["end"] * 1000))),
+                    seg["text"].strip()
+                )
+            logger.info(f"语音识别成功！成功解析出 {len(segments)} 个文本段落")
+            
+            return {
+                "status": "success",
+                "filename": os.path.basename(audio_path),
+                "segments": segments,
+                "processing_time": None,
+                "model": "whisper.cpp-server"
+            }
+            
+        except FileNotFoundError:
+            logger.error(f"文件不存在: {audio_path}")
+            return None
+        except requests.exceptions.ConnectionError as e:
+            # 服务已不可达（如进程崩溃），退回到 whisper-cli
+            logger.warning(f"无法连接 whisper-server，改用 whisper-cli: {str(e)}")
+            return super().recognize_audio(audio_path)
+        except Exception as e:
+            logger.error(f"通过 whisper-server 识别时发生错误: {str(e)}", exc_info=True)
+            return None
 
 # 便捷函数
-def recognize_audio(audio_path: str, server_url: str = "http://localhost:8000") -> Optional[Dict[str, Any]]:
+def recognize_audio(
+    audio_path: str,
+    server_url: str = "http://localhost:8000",
+    session: Optional[requests.Session] = None
+) -> Optional[Dict[str, Any]]:
     """
     识别音频文件的便捷函数
     
     Args:
         audio_path: 音频文件路径
         server_url: ASR服务器URL
+        session: 可选的共享会话，多次调用时传入可复用连接池
         
     Returns:
         识别结果，失败时返回None
     """
-    client = ASRClient(server_url)
-    return client.recognize_audio(audio_path)
+    with ASRClient(server_url, session=session) as client:
+        return client.recognize_audio(audio_path)
 
 
 if __name__ == "__main__":
@@ -12,7 +12,7 @@ import traceback
 import sys
 from typing import Dict, Any, List, Optional
 
-from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 
@@ -88,6 +88,11 @@ class ASRServer:
         async def health_check():
             return {"status": "healthy", "model_loaded": self.model is not None}
         
+        # 轻量健康检查，模型加载状态通过响应头返回
+        @self.app.head("/health")
+        async def health_check_head():
+            return Response(headers={"X-Model-Loaded": "true" if self.model is not None else "false"})
+        
         # 注册语音识别接口
         @self.app.post("/asr/recognize")
         async def recognize_speech(file: UploadFile = File(...)) -> Dict[str, Any]:
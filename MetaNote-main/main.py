@@ -135,13 +135,12 @@ def process_video(
         if not segments:
             raise RuntimeError("语音识别失败：未解析出任何段落")
             
-        # 如果需要将段落拼接成完整文本
-        transcript = "\n".join([f"[{seg['start']} --> {seg['end']}] {seg['text']}" for seg in segments])
-        # 或者直接使用完整文本
-        transcript = asr_result.get("full_text", "")
+        # 将段落拼接成完整文本（本地模式不再返回原始输出 full_text）
+        transcript = "\n".join(f"[{seg['start']} --> {seg['end']}] {seg['text']}" for seg in segments)
             
         result["transcript"] = transcript
-        result["segments"] = segments  # 保存结构化段落，可能对后续处理有用
+        # 保存结构化段落，可能对后续处理有用；需要 JSON 序列化时再调用 to_list()/to_dict()
+        result["segments"] = segments
         
         # 4. 提取关键帧
         logger.info("正在提取关键帧...")